@@ -1,9 +1,19 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import abc
+import asyncio
+import gzip
+import hashlib
+import json
+import math
+import time
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
@@ -13,6 +23,7 @@ from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
 from enum import Enum
+from collections import OrderedDict
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -27,6 +38,42 @@ SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Rate limiting and admission control
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # "memory" or "mongo"
+AUTH_RATE_LIMIT = int(os.environ.get('AUTH_RATE_LIMIT', '10'))  # requests per window
+AUTH_RATE_WINDOW_SECONDS = int(os.environ.get('AUTH_RATE_WINDOW_SECONDS', '60'))
+SUBMIT_RATE_LIMIT = int(os.environ.get('SUBMIT_RATE_LIMIT', '20'))
+SUBMIT_RATE_WINDOW_SECONDS = int(os.environ.get('SUBMIT_RATE_WINDOW_SECONDS', '60'))
+# Number of reverse proxies in front of the app that append to X-Forwarded-For; 0 ignores the header.
+# Behind a proxy with 0, every client shares the proxy's address and therefore one IP bucket.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+MAX_REQUEST_BODY_BYTES = int(os.environ.get('MAX_REQUEST_BODY_BYTES', str(256 * 1024)))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '100'))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', '0.5'))
+MAX_TYPING_WPM = 250  # upper bound used to cap typed_text length per test duration
+CHARS_PER_WORD = 5
+
+# Data retention
+# Raw attempts are kept for at least a week because the weekly leaderboard reads them
+ARCHIVE_RETENTION_DAYS = max(int(os.environ.get('ARCHIVE_RETENTION_DAYS', '90')), 7)
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', str(ROOT_DIR / 'archive')))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', '24'))  # 0 disables
+ARCHIVE_BATCH_SIZE = 5000  # raw documents per archive file
+ARCHIVE_LEASE_SECONDS = 3600  # how long a compaction run may hold the lock between batches
+ARCHIVE_APPLIED_BATCH_HISTORY = 20  # batch ids remembered per summary to make retries no-ops
+
+# Live leaderboard feed
+LEADERBOARD_STREAM_PATH = "/api/leaderboard/stream"
+LEADERBOARD_STREAM_TOP_N = int(os.environ.get('LEADERBOARD_STREAM_TOP_N', '50'))
+LEADERBOARD_STREAM_BUFFER = int(os.environ.get('LEADERBOARD_STREAM_BUFFER', '16'))  # events queued per client
+LEADERBOARD_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('LEADERBOARD_STREAM_MAX_SUBSCRIBERS', '10000'))
+LEADERBOARD_STREAM_KEEPALIVE_SECONDS = 15
+# Streams end after this long and the browser reconnects for a fresh snapshot. This bounds how long
+# an open dashboard can hold up a graceful shutdown, since uvicorn drains connections first.
+LEADERBOARD_STREAM_MAX_SECONDS = float(os.environ.get('LEADERBOARD_STREAM_MAX_SECONDS', '300'))
+LEADERBOARD_STREAM_RETRY_MS = 3000  # reconnect delay suggested to EventSource
+LEADERBOARD_MIN_RECOMPUTE_SECONDS = float(os.environ.get('LEADERBOARD_MIN_RECOMPUTE_SECONDS', '1'))
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
@@ -80,7 +127,7 @@ class PracticeSession(BaseModel):
     user_id: str
     mode: str
     duration: int  # in seconds
-    text_content: str
+    content_hash: str  # key into the passages collection
     wpm: float
     accuracy: float
     errors: int
@@ -207,8 +254,219 @@ async def update_user_streak(user_id: str):
             {"$set": {"streak_days": 1, "last_practice_date": today}}
         )
 
+# ===== RATE LIMITING =====
+class RateLimitBackend(abc.ABC):
+    """Token bucket storage. Subclass and implement consume() to plug in a shared store."""
+
+    @abc.abstractmethod
+    async def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        """Take one token from the bucket at key.
+
+        Returns 0 if the request is allowed, otherwise the seconds until a token is available.
+        """
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process buckets. Only correct when the app runs as a single worker.
+
+    Buckets are kept in least-recently-used order and the stalest one is evicted at max_keys.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    async def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self.buckets.popitem(last=False)
+            bucket = [float(capacity), now]
+            self.buckets[key] = bucket
+        else:
+            self.buckets.move_to_end(key)
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / refill_rate
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """Buckets shared by every worker, refilled and consumed atomically in a single update."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        now = datetime.now(timezone.utc)
+        now_ts = now.timestamp()
+        refilled = {"$min": [
+            capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [{"$subtract": [now_ts, {"$ifNull": ["$updated_at", now_ts]}]}, refill_rate]}
+            ]}
+        ]}
+        bucket = await self.collection.find_one_and_update(
+            {"key": key},
+            [
+                {"$set": {"tokens": refilled}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "updated_at": now_ts,
+                    "expires_at": now + timedelta(seconds=capacity / refill_rate)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return 0
+        return (1 - bucket["tokens"]) / refill_rate
+
+def build_rate_limit_backend() -> RateLimitBackend:
+    if RATE_LIMIT_BACKEND == "mongo":
+        return MongoRateLimitBackend(db.rate_limits)
+    return InMemoryRateLimitBackend()
+
+rate_limit_backend = build_rate_limit_backend()
+
+def get_client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # Entries left of the ones our own proxies appended are client-controlled
+            hops = [hop.strip() for hop in forwarded.split(",")]
+            return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limit(key: str, limit: int, window_seconds: int):
+    retry_after = await rate_limit_backend.consume(key, limit, limit / window_seconds)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+def rate_limit(scope: str, limit: int, window_seconds: int, per_user: bool = False):
+    """Build a dependency that limits requests by client IP, or by user id if per_user.
+
+    Authenticated routes are keyed by user only, so users sharing a NAT don't share a bucket.
+    """
+    async def limit_by_ip(request: Request):
+        await enforce_rate_limit(f"{scope}:ip:{get_client_ip(request)}", limit, window_seconds)
+
+    async def limit_by_user(user: dict = Depends(get_current_user)):
+        await enforce_rate_limit(f"{scope}:user:{user['id']}", limit, window_seconds)
+
+    return limit_by_user if per_user else limit_by_ip
+
+auth_rate_limit = rate_limit("auth", AUTH_RATE_LIMIT, AUTH_RATE_WINDOW_SECONDS)
+submit_rate_limit = rate_limit("submit", SUBMIT_RATE_LIMIT, SUBMIT_RATE_WINDOW_SECONDS, per_user=True)
+
+def max_typed_text_length(duration: int) -> int:
+    return max(duration, 1) * MAX_TYPING_WPM * CHARS_PER_WORD // 60
+
+# ===== ADMISSION CONTROL =====
+class AdmissionControlMiddleware:
+    """Rejects oversized bodies with 413 and sheds load with 503 once too many requests are in flight.
+
+    Long-lived streams listed in exempt_paths bypass the concurrency cap so they don't hold slots forever.
+    """
+
+    def __init__(self, app, max_concurrent: int, queue_timeout: float, max_body_bytes: int, exempt_paths: tuple = ()):
+        self.app = app
+        self.queue_timeout = queue_timeout
+        self.max_body_bytes = max_body_bytes
+        self.exempt_paths = set(exempt_paths)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                too_large = int(content_length) > self.max_body_bytes
+            except ValueError:
+                too_large = True
+            if too_large:
+                await self._reject(scope, receive, send, 413, "Request body too large")
+                return
+        elif headers.get(b"transfer-encoding", b"").lower() == b"chunked":
+            body = await self._read_body(receive)
+            if body is None:
+                await self._reject(scope, receive, send, 413, "Request body too large")
+                return
+            receive = self._replay(body, receive)
+
+        if not await self._acquire():
+            await self._reject(scope, receive, send, 503, "Server busy, try again shortly", {"Retry-After": "1"})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.semaphore.release()
+
+    async def _acquire(self) -> bool:
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            return True
+        if self.queue_timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _read_body(self, receive) -> Optional[bytes]:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return replay_receive
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
+
 # ===== AUTH ROUTES =====
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", dependencies=[Depends(auth_rate_limit)])
 async def register(user_data: UserRegister):
     existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
     if existing:
@@ -242,7 +500,7 @@ async def register(user_data: UserRegister):
         }
     }
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", dependencies=[Depends(auth_rate_limit)])
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user or not verify_password(credentials.password, user["password"]):
@@ -277,12 +535,17 @@ async def get_me(user: dict = Depends(get_current_user)):
 # ===== PRACTICE ROUTES =====
 @api_router.post("/practice/session")
 async def create_practice_session(session_data: PracticeSessionCreate, user: dict = Depends(get_current_user)):
+    # Only passages served by /practice/content are accepted, so passages stays bounded
+    content_hash = passage_hash(session_data.original_text)
+    if content_hash not in PRACTICE_PASSAGES:
+        raise HTTPException(status_code=400, detail="Unknown practice passage")
+    
     session_dict = {
         "id": str(uuid.uuid4()),
         "user_id": user["id"],
         "mode": session_data.mode,
         "duration": session_data.duration,
-        "text_content": session_data.original_text,
+        "content_hash": content_hash,
         "wpm": session_data.wpm,
         "accuracy": session_data.accuracy,
         "errors": session_data.errors,
@@ -304,6 +567,8 @@ async def create_practice_session(session_data: PracticeSessionCreate, user: dic
     # Update streak
     await update_user_streak(user["id"])
     
+    leaderboard_broadcaster.notify()
+    
     return {"id": session_dict["id"], "xp_gained": xp_gained, "new_xp": new_xp, "new_level": new_level}
 
 @api_router.get("/practice/history")
@@ -316,10 +581,13 @@ async def get_practice_history(user: dict = Depends(get_current_user), limit: in
 
 @api_router.get("/practice/stats")
 async def get_practice_stats(user: dict = Depends(get_current_user)):
-    sessions = await db.practice_sessions.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    tests = await db.test_results.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
+    # Documents tagged for archiving may already be counted in the summary
+    raw = {"user_id": user["id"], "archive_batch": {"$exists": False}}
+    sessions = await db.practice_sessions.find(raw, {"_id": 0}).to_list(1000)
+    tests = await db.test_results.find(raw, {"_id": 0}).to_list(1000)
+    summary = await get_user_summary(user["id"])
     
-    if not sessions and not tests:
+    if not sessions and not tests and not summary:
         return {
             "total_tests": 0,
             "average_wpm": 0,
@@ -328,12 +596,16 @@ async def get_practice_stats(user: dict = Depends(get_current_user)):
             "total_practice_time": 0
         }
     
+    # Fold in attempts that have been compacted into the per-user summary
+    summary = summary or {}
     all_results = sessions + tests
-    total_tests = len(all_results)
-    avg_wpm = sum(r["wpm"] for r in all_results) / total_tests if total_tests > 0 else 0
-    avg_accuracy = sum(r["accuracy"] for r in all_results) / total_tests if total_tests > 0 else 0
-    best_wpm = max((r["wpm"] for r in all_results), default=0)
-    total_time = sum(s.get("duration", 0) for s in sessions)
+    total_tests = len(all_results) + summary.get("practice_sessions", 0) + summary.get("test_results", 0)
+    total_wpm = sum(r["wpm"] for r in all_results) + summary.get("practice_wpm_total", 0) + summary.get("test_wpm_total", 0)
+    total_accuracy = sum(r["accuracy"] for r in all_results) + summary.get("practice_accuracy_total", 0) + summary.get("test_accuracy_total", 0)
+    avg_wpm = total_wpm / total_tests if total_tests > 0 else 0
+    avg_accuracy = total_accuracy / total_tests if total_tests > 0 else 0
+    best_wpm = max([r["wpm"] for r in all_results] + [summary.get("best_wpm", 0)])
+    total_time = sum(s.get("duration", 0) for s in sessions) + summary.get("practice_time_total", 0)
     
     return {
         "total_tests": total_tests,
@@ -343,16 +615,24 @@ async def get_practice_stats(user: dict = Depends(get_current_user)):
         "total_practice_time": total_time
     }
 
+PRACTICE_CONTENT = {
+    "words": "the quick brown fox jumps over the lazy dog pack my box with five dozen liquor jugs sphinx of black quartz judge my vow how vexingly quick daft zebras jump waltz nymph for quick jigs vex bud crazy frederick bought many very exquisite opal jewels",
+    "sentences": "The sun sets over the horizon painting the sky in shades of orange and pink. Technology has transformed the way we communicate and interact with each other. Learning new skills requires dedication patience and consistent practice. Every journey begins with a single step forward into the unknown.",
+    "paragraphs": "In the digital age, the ability to type quickly and accurately has become an essential skill for professional success. Whether you are writing emails, creating documents, or communicating with colleagues, your typing speed directly impacts your productivity. Regular practice with structured exercises can significantly improve your typing abilities over time. The key is to maintain proper finger positioning and develop muscle memory through repetition. As you progress, you will notice that your speed increases naturally while your accuracy improves. Consistent daily practice, even for just fifteen minutes, can lead to remarkable improvements in your typing proficiency.",
+    "numbers": "1234567890 9876543210 1029384756 5647382910 3141592653 2718281828 1618033988 1414213562 1732050807 2236067977 9999888877 7766555544 4433221100 1357924680 2468013579",
+    "punctuation": "Hello, world! How are you today? I'm doing great, thanks for asking. Let's practice some punctuation: semicolons; colons: and commas, periods. Don't forget apostrophes, quotation marks, and hyphens-dashes. Question marks? Exclamation points! Parentheses (like this) and brackets [also these]."
+}
+
 @api_router.get("/practice/content/{mode}")
 async def get_practice_content(mode: str):
-    content_map = {
-        "words": "the quick brown fox jumps over the lazy dog pack my box with five dozen liquor jugs sphinx of black quartz judge my vow how vexingly quick daft zebras jump waltz nymph for quick jigs vex bud crazy frederick bought many very exquisite opal jewels",
-        "sentences": "The sun sets over the horizon painting the sky in shades of orange and pink. Technology has transformed the way we communicate and interact with each other. Learning new skills requires dedication patience and consistent practice. Every journey begins with a single step forward into the unknown.",
-        "paragraphs": "In the digital age, the ability to type quickly and accurately has become an essential skill for professional success. Whether you are writing emails, creating documents, or communicating with colleagues, your typing speed directly impacts your productivity. Regular practice with structured exercises can significantly improve your typing abilities over time. The key is to maintain proper finger positioning and develop muscle memory through repetition. As you progress, you will notice that your speed increases naturally while your accuracy improves. Consistent daily practice, even for just fifteen minutes, can lead to remarkable improvements in your typing proficiency.",
-        "numbers": "1234567890 9876543210 1029384756 5647382910 3141592653 2718281828 1618033988 1414213562 1732050807 2236067977 9999888877 7766555544 4433221100 1357924680 2468013579",
-        "punctuation": "Hello, world! How are you today? I'm doing great, thanks for asking. Let's practice some punctuation: semicolons; colons: and commas, periods. Don't forget apostrophes, quotation marks, and hyphens-dashes. Question marks? Exclamation points! Parentheses (like this) and brackets [also these]."
-    }
-    return {"content": content_map.get(mode, content_map["words"])}
+    return {"content": PRACTICE_CONTENT.get(mode, PRACTICE_CONTENT["words"])}
+
+@api_router.get("/practice/passages/{content_hash}")
+async def get_passage(content_hash: str):
+    passage = await db.passages.find_one({"hash": content_hash}, {"_id": 0})
+    if not passage:
+        raise HTTPException(status_code=404, detail="Passage not found")
+    return passage
 
 # ===== TEST ROUTES =====
 @api_router.get("/tests")
@@ -371,12 +651,15 @@ async def get_test(test_id: str):
         raise HTTPException(status_code=404, detail="Test not found")
     return test
 
-@api_router.post("/tests/submit")
+@api_router.post("/tests/submit", dependencies=[Depends(submit_rate_limit)])
 async def submit_test(result: TestResultCreate, user: dict = Depends(get_current_user)):
     test = await db.typing_tests.find_one({"id": result.test_id}, {"_id": 0})
     if not test:
         raise HTTPException(status_code=404, detail="Test not found")
     
+    if len(result.typed_text) > max_typed_text_length(test["duration"]):
+        raise HTTPException(status_code=400, detail="Typed text is too long for this test")
+    
     passed = result.wpm >= test["target_wpm"] and result.accuracy >= 90
     
     result_dict = {
@@ -409,6 +692,8 @@ async def submit_test(result: TestResultCreate, user: dict = Depends(get_current
     
     await update_user_streak(user["id"])
     
+    leaderboard_broadcaster.notify()
+    
     return {
         "id": result_dict["id"],
         "passed": passed,
@@ -489,13 +774,167 @@ async def get_weekly_leaderboard(limit: int = 50):
     leaderboard.sort(key=lambda x: x["wpm"], reverse=True)
     return leaderboard[:limit]
 
+@api_router.get("/leaderboard/stream")
+async def stream_leaderboard():
+    if len(leaderboard_broadcaster.subscribers) >= LEADERBOARD_STREAM_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many leaderboard subscribers", headers={"Retry-After": "5"})
+    
+    queue = await leaderboard_broadcaster.subscribe()
+    
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LEADERBOARD_STREAM_MAX_SECONDS
+        try:
+            yield f"retry: {LEADERBOARD_STREAM_RETRY_MS}\n\n"
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), min(LEADERBOARD_STREAM_KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                name, data = event
+                yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            leaderboard_broadcaster.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 async def get_user_best_stats(user_id: str):
-    sessions = await db.practice_sessions.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    sessions = await db.practice_sessions.find(
+        {"user_id": user_id, "archive_batch": {"$exists": False}},
+        {"_id": 0}
+    ).to_list(1000)
+    summary = await get_user_summary(user_id)
+    if summary and "best_session" in summary:
+        sessions.append(summary["best_session"])
     if not sessions:
         return {"wpm": 0, "accuracy": 0}
     best_session = max(sessions, key=lambda x: x["wpm"])
     return {"wpm": round(best_session["wpm"], 2), "accuracy": round(best_session["accuracy"], 2)}
 
+# ===== LIVE LEADERBOARD =====
+def leaderboard_diff(old: Dict[str, list], new: Dict[str, list]) -> Dict[str, dict]:
+    """Ranks whose entry changed, per board, plus the new board size so clients can truncate."""
+    diff = {}
+    for board, entries in new.items():
+        previous = old.get(board, [])
+        changes = [
+            {"rank": rank, "entry": entry}
+            for rank, entry in enumerate(entries, start=1)
+            if rank > len(previous) or previous[rank - 1] != entry
+        ]
+        if changes or len(entries) != len(previous):
+            diff[board] = {"size": len(entries), "changes": changes}
+    return diff
+
+class LeaderboardBroadcaster:
+    """Recomputes the leaderboards once per change and fans the diff out to every SSE subscriber.
+
+    All recomputes run under one lock, so concurrent subscribers share a single computation and a
+    snapshot is only ever replaced by one started later. Changes are only seen by the process that
+    made them, so each worker feeds its own subscribers.
+    """
+
+    def __init__(self, top_n: int, buffer_size: int, min_interval: float):
+        self.top_n = top_n
+        self.buffer_size = buffer_size
+        self.min_interval = min_interval
+        self.subscribers: set = set()
+        self.snapshot: Optional[Dict[str, list]] = None
+        self.version = 0  # bumped on every change
+        self.snapshot_version = -1  # change the current snapshot reflects
+        self.lock = asyncio.Lock()
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def notify(self):
+        self.version += 1
+        self.changed.set()
+
+    async def compute(self) -> Dict[str, list]:
+        return {
+            "global": await get_global_leaderboard(self.top_n),
+            "weekly": await get_weekly_leaderboard(self.top_n)
+        }
+
+    async def refresh(self, only_if_missing: bool = False):
+        """Bring the snapshot up to date and publish the diff to current subscribers."""
+        async with self.lock:
+            if self.snapshot is not None and (only_if_missing or self.snapshot_version == self.version):
+                return
+            version = self.version
+            snapshot = await self.compute()
+            previous = self.snapshot
+            self.snapshot, self.snapshot_version = snapshot, version
+            if previous is not None:
+                diff = leaderboard_diff(previous, snapshot)
+                if diff:
+                    self._publish(("diff", diff))
+
+    async def subscribe(self) -> asyncio.Queue:
+        # Any snapshot will do: a pending change is diffed out to this subscriber once it is registered
+        await self.refresh(only_if_missing=True)
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        queue.put_nowait(("snapshot", self.snapshot))
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            async with self.lock:
+                # Checked under the lock: a subscriber may register while a computation is in flight
+                idle = not self.subscribers
+                if idle:
+                    # Nobody is listening; recompute when the next subscriber arrives
+                    self.snapshot = None
+            if idle:
+                continue
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Leaderboard recompute failed")
+                continue
+            # Coalesce bursts of submissions into one recompute
+            await asyncio.sleep(self.min_interval)
+
+    def _publish(self, event):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow consumer: drop it instead of buffering without bound; the None ends its stream
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+leaderboard_broadcaster = LeaderboardBroadcaster(
+    LEADERBOARD_STREAM_TOP_N,
+    LEADERBOARD_STREAM_BUFFER,
+    LEADERBOARD_MIN_RECOMPUTE_SECONDS
+)
+
 # ===== ADMIN ROUTES =====
 @api_router.post("/admin/tests")
 async def create_test(test_data: dict, user: dict = Depends(get_current_user)):
@@ -554,6 +993,16 @@ async def get_all_users(user: dict = Depends(get_current_user), skip: int = 0, l
     
     return users
 
+@api_router.post("/admin/archive")
+async def run_archive(user: dict = Depends(get_current_user)):
+    if not user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    result = await compact_raw_history()
+    if result is None:
+        raise HTTPException(status_code=409, detail="Compaction already running")
+    return result
+
 @api_router.get("/admin/stats")
 async def get_admin_stats(user: dict = Depends(get_current_user)):
     if not user.get("is_admin", False):
@@ -571,6 +1020,263 @@ async def get_admin_stats(user: dict = Depends(get_current_user)):
         "total_test_results": total_results
     }
 
+# ===== DATA RETENTION =====
+def passage_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+PRACTICE_PASSAGES = {passage_hash(text): text for text in PRACTICE_CONTENT.values()}
+
+compaction_lock = asyncio.Lock()
+compaction_owner = str(uuid.uuid4())  # identifies this process's compaction lease
+
+async def store_passage(content_hash: str, text: str):
+    await db.passages.update_one(
+        {"hash": content_hash},
+        {"$setOnInsert": {"hash": content_hash, "content": text, "created_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+
+async def seed_practice_passages():
+    for content_hash, text in PRACTICE_PASSAGES.items():
+        await store_passage(content_hash, text)
+
+async def get_user_summary(user_id: str) -> Optional[dict]:
+    return await db.user_history_summaries.find_one({"user_id": user_id}, {"_id": 0, "applied_batches": 0})
+
+async def ensure_history_indexes():
+    await db.passages.create_index("hash", unique=True)
+    await db.user_history_summaries.create_index("user_id", unique=True)
+    await db.practice_sessions.create_index([("user_id", 1), ("created_at", -1)])
+    await db.practice_sessions.create_index("created_at")
+    await db.practice_sessions.create_index("content_hash")
+    await db.practice_sessions.create_index("archive_batch", sparse=True)
+    await db.test_results.create_index([("user_id", 1), ("created_at", -1)])
+    await db.test_results.create_index("created_at")
+    await db.test_results.create_index("archive_batch", sparse=True)
+
+async def migrate_session_passages() -> int:
+    """Replace text_content on sessions written before passages were deduplicated. Runs once."""
+    if await db.migrations.find_one({"_id": "session_passages"}):
+        return 0
+    
+    migrated = 0
+    last_id = None
+    while True:
+        # Walk forward by _id so each pass starts where the previous one stopped
+        query = {"text_content": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        sessions = await db.practice_sessions.find(
+            query,
+            {"id": 1, "text_content": 1}
+        ).sort("_id", 1).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not sessions:
+            break
+        last_id = sessions[-1]["_id"]
+        
+        # Legacy sessions repeat a handful of passages, so update each passage's sessions together
+        by_passage: Dict[str, list] = {}
+        for session in sessions:
+            by_passage.setdefault(session["text_content"], []).append(session["_id"])
+        for text, session_ids in by_passage.items():
+            content_hash = passage_hash(text)
+            await store_passage(content_hash, text)
+            await db.practice_sessions.update_many(
+                {"_id": {"$in": session_ids}},
+                {"$set": {"content_hash": content_hash}, "$unset": {"text_content": ""}}
+            )
+        migrated += len(sessions)
+    
+    await db.migrations.update_one(
+        {"_id": "session_passages"},
+        {"$set": {"migrated": migrated, "completed_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return migrated
+
+async def run_session_passage_migration():
+    try:
+        migrated = await migrate_session_passages()
+        if migrated:
+            logger.info(f"Moved passages of {migrated} practice sessions into the passages collection")
+    except Exception:
+        logger.exception("Practice session passage migration failed")
+
+async def acquire_compaction_lease() -> bool:
+    """Take or renew the cluster-wide compaction lease. False if another process holds it."""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.locks.update_one(
+            {"_id": "compaction", "$or": [{"expires_at": {"$lt": now}}, {"owner": compaction_owner}]},
+            {"$set": {"owner": compaction_owner, "expires_at": now + timedelta(seconds=ARCHIVE_LEASE_SECONDS)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def release_compaction_lease():
+    await db.locks.delete_one({"_id": "compaction", "owner": compaction_owner})
+
+def summarize_practice_session(summary: dict, session: dict):
+    inc = summary["$inc"]
+    inc["practice_sessions"] = inc.get("practice_sessions", 0) + 1
+    inc["practice_wpm_total"] = inc.get("practice_wpm_total", 0) + session["wpm"]
+    inc["practice_accuracy_total"] = inc.get("practice_accuracy_total", 0) + session["accuracy"]
+    inc["practice_time_total"] = inc.get("practice_time_total", 0) + session.get("duration", 0)
+    best = summary["$max"]
+    best["best_wpm"] = max(best.get("best_wpm", 0), session["wpm"])
+    # wpm decides and accuracy breaks ties, matching summary_update_pipeline
+    current = best.get("best_session", {"wpm": -1, "accuracy": -1})
+    if (session["wpm"], session["accuracy"]) > (current["wpm"], current["accuracy"]):
+        best["best_session"] = {"wpm": session["wpm"], "accuracy": session["accuracy"]}
+
+def summarize_test_result(summary: dict, result: dict):
+    inc = summary["$inc"]
+    inc["test_results"] = inc.get("test_results", 0) + 1
+    inc["test_wpm_total"] = inc.get("test_wpm_total", 0) + result["wpm"]
+    inc["test_accuracy_total"] = inc.get("test_accuracy_total", 0) + result["accuracy"]
+    inc["tests_passed"] = inc.get("tests_passed", 0) + int(result.get("passed", False))
+    best = summary["$max"]
+    best["best_wpm"] = max(best.get("best_wpm", 0), result["wpm"])
+
+def summary_update_pipeline(summary: dict, batch_id: str) -> list:
+    """Turn the deltas built by summarize_* into an update that also records batch_id."""
+    fields = {
+        field: {"$add": [{"$ifNull": [f"${field}", 0]}, value]}
+        for field, value in summary["$inc"].items()
+    }
+    best = summary["$max"]
+    fields["best_wpm"] = {"$max": [{"$ifNull": ["$best_wpm", 0]}, best["best_wpm"]]}
+    if "best_session" in best:
+        wpm, accuracy = best["best_session"]["wpm"], best["best_session"]["accuracy"]
+        better = {"$or": [
+            {"$gt": [wpm, {"$ifNull": ["$best_session.wpm", -1]}]},
+            {"$and": [{"$eq": [wpm, "$best_session.wpm"]}, {"$gt": [accuracy, "$best_session.accuracy"]}]}
+        ]}
+        fields["best_session"] = {"$cond": [better, {"wpm": wpm, "accuracy": accuracy}, "$best_session"]}
+    fields["applied_batches"] = {"$slice": [
+        {"$concatArrays": [{"$ifNull": ["$applied_batches", []]}, [batch_id]]},
+        -ARCHIVE_APPLIED_BATCH_HISTORY
+    ]}
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    return [{"$set": fields}]
+
+def write_archive(path: Path, docs: List[dict]):
+    partial = path.with_name(path.name + ".partial")
+    with gzip.open(partial, "wt", encoding="utf-8") as archive_file:
+        archive_file.writelines(json.dumps(doc, default=str) + "\n" for doc in docs)
+    partial.replace(path)
+
+async def archive_batch(name: str, batch_id: str, summarize) -> int:
+    """Archive, summarize and delete the documents tagged with batch_id.
+
+    The passages the documents reference are archived alongside them, so the archive can be read
+    after those passages are removed. Every step can be repeated after a crash: archive files are
+    rewritten under the same names, summaries skip batches they have already applied, and only
+    tagged documents are deleted.
+    """
+    docs = await db[name].find({"archive_batch": batch_id}, {"_id": 0}).to_list(None)
+    if not docs:
+        return 0
+    
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    hashes = sorted({doc["content_hash"] for doc in docs if doc.get("content_hash")})
+    if hashes:
+        passages = await db.passages.find({"hash": {"$in": hashes}}, {"_id": 0}).to_list(None)
+        await asyncio.to_thread(write_archive, ARCHIVE_DIR / f"passages-{batch_id}.ndjson.gz", passages)
+    path = ARCHIVE_DIR / f"{name}-{batch_id}.ndjson.gz"
+    await asyncio.to_thread(write_archive, path, docs)
+    
+    summaries: Dict[str, dict] = {}
+    for doc in docs:
+        summarize(summaries.setdefault(doc["user_id"], {"$inc": {}, "$max": {}}), doc)
+    for user_id, summary in summaries.items():
+        try:
+            await db.user_history_summaries.update_one(
+                {"user_id": user_id, "applied_batches": {"$ne": batch_id}},
+                summary_update_pipeline(summary, batch_id),
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # the summary already includes this batch
+    
+    await db[name].delete_many({"archive_batch": batch_id})
+    logger.info(f"Archived {len(docs)} {name} documents to {path}")
+    return len(docs)
+
+async def archive_collection(name: str, cutoff: str, summarize) -> Optional[int]:
+    """Move documents older than cutoff into archives and summaries. None if the lease was lost."""
+    archived = 0
+    # Finish batches an interrupted run had already tagged
+    for batch_id in await db[name].distinct("archive_batch"):
+        archived += await archive_batch(name, batch_id, summarize)
+    
+    while True:
+        if not await acquire_compaction_lease():
+            return None
+        docs = await db[name].find(
+            {"created_at": {"$lt": cutoff}, "archive_batch": {"$exists": False}},
+            {"_id": 0, "id": 1}
+        ).sort("created_at", 1).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not docs:
+            return archived
+        
+        batch_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex}"
+        await db[name].update_many(
+            {"id": {"$in": [doc["id"] for doc in docs]}},
+            {"$set": {"archive_batch": batch_id}}
+        )
+        archived += await archive_batch(name, batch_id, summarize)
+
+async def delete_unreferenced_passages() -> int:
+    """Remove passages no live session uses; archive_batch has already copied them into the archives."""
+    if not await db.migrations.find_one({"_id": "session_passages"}):
+        return 0  # the migration inserts passages before the sessions that reference them
+    referenced = set(await db.practice_sessions.distinct("content_hash")) | set(PRACTICE_PASSAGES)
+    result = await db.passages.delete_many({"hash": {"$nin": list(referenced)}})
+    return result.deleted_count
+
+async def compact_raw_history() -> Optional[dict]:
+    """Move raw attempts past the retention window into archives and per-user summaries.
+
+    Returns None without doing anything if another compaction run holds the lease.
+    """
+    if compaction_lock.locked():
+        return None
+    async with compaction_lock:
+        if not await acquire_compaction_lease():
+            return None
+        try:
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=ARCHIVE_RETENTION_DAYS)).isoformat()
+            archived_sessions = await archive_collection("practice_sessions", cutoff, summarize_practice_session)
+            archived_results = await archive_collection("test_results", cutoff, summarize_test_result)
+            if archived_sessions is None or archived_results is None:
+                logger.warning("Lost the compaction lease; stopping early")
+                return None
+            deleted_passages = await delete_unreferenced_passages()
+        finally:
+            await release_compaction_lease()
+    
+    return {
+        "cutoff": cutoff,
+        "archived_practice_sessions": archived_sessions,
+        "archived_test_results": archived_results,
+        "deleted_passages": deleted_passages
+    }
+
+async def run_periodic_compaction():
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+        try:
+            result = await compact_raw_history()
+            if result is None:
+                logger.info("Skipped raw history compaction; another run holds the lease")
+            else:
+                logger.info(f"Compacted raw history: {result}")
+        except Exception:
+            logger.exception("Raw history compaction failed")
+
 # ===== INITIALIZE DEFAULT DATA =====
 async def initialize_default_tests():
     tests_data = [
@@ -680,6 +1386,14 @@ async def initialize_default_tests():
 # Include router
 app.include_router(api_router)
 
+app.add_middleware(
+    AdmissionControlMiddleware,
+    max_concurrent=MAX_CONCURRENT_REQUESTS,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    max_body_bytes=MAX_REQUEST_BODY_BYTES,
+    exempt_paths=(LEADERBOARD_STREAM_PATH,),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -696,6 +1410,15 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    if isinstance(rate_limit_backend, MongoRateLimitBackend):
+        await rate_limit_backend.ensure_indexes()
+    await ensure_history_indexes()
+    await seed_practice_passages()
+    app.state.migration_task = asyncio.create_task(run_session_passage_migration())
+    if ARCHIVE_INTERVAL_HOURS > 0:
+        app.state.compaction_task = asyncio.create_task(run_periodic_compaction())
+    leaderboard_broadcaster.start()
+    
     # Initialize default tests if none exist
     test_count = await db.typing_tests.count_documents({})
     if test_count == 0:
@@ -704,4 +1427,9 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task_name in ("compaction_task", "migration_task"):
+        task = getattr(app.state, task_name, None)
+        if task:
+            task.cancel()
+    leaderboard_broadcaster.stop()
     client.close()
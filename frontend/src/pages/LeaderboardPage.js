@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import axios from "axios";
 import Navbar from "@/components/Navbar";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
@@ -14,22 +14,61 @@ const LeaderboardPage = () => {
   const [globalLeaderboard, setGlobalLeaderboard] = useState([]);
   const [weeklyLeaderboard, setWeeklyLeaderboard] = useState([]);
   const [loading, setLoading] = useState(true);
+  const streamUpdates = useRef(0);
+  const fallbackPending = useRef(false);
 
   useEffect(() => {
-    fetchLeaderboards();
+    // Live updates: the server sends a full snapshot, then only the ranks that changed
+    const source = new EventSource(`${API}/leaderboard/stream`);
+    source.addEventListener("snapshot", (event) => {
+      streamUpdates.current += 1;
+      const snapshot = JSON.parse(event.data);
+      setGlobalLeaderboard(snapshot.global);
+      setWeeklyLeaderboard(snapshot.weekly);
+      setLoading(false);
+    });
+    source.addEventListener("diff", (event) => {
+      streamUpdates.current += 1;
+      const diff = JSON.parse(event.data);
+      if (diff.global) setGlobalLeaderboard((current) => applyDiff(current, diff.global));
+      if (diff.weekly) setWeeklyLeaderboard((current) => applyDiff(current, diff.weekly));
+    });
+    source.onerror = () => {
+      // Fall back to a one-off fetch if the stream never delivered or the server refused it;
+      // otherwise the browser reconnects and the next snapshot replaces what is on screen
+      if (streamUpdates.current === 0 || source.readyState === EventSource.CLOSED) {
+        fetchLeaderboards();
+      }
+    };
+    return () => source.close();
   }, []);
 
+  const applyDiff = (entries, { size, changes }) => {
+    const updated = entries.slice(0, size);
+    changes.forEach(({ rank, entry }) => {
+      updated[rank - 1] = entry;
+    });
+    return updated;
+  };
+
   const fetchLeaderboards = async () => {
+    if (fallbackPending.current) return;
+    fallbackPending.current = true;
+    const updatesBefore = streamUpdates.current;
     try {
       const [globalRes, weeklyRes] = await Promise.all([
         axios.get(`${API}/leaderboard/global`),
         axios.get(`${API}/leaderboard/weekly`)
       ]);
-      setGlobalLeaderboard(globalRes.data);
-      setWeeklyLeaderboard(weeklyRes.data);
+      // Stream data that arrived meanwhile is newer than this response
+      if (streamUpdates.current === updatesBefore) {
+        setGlobalLeaderboard(globalRes.data);
+        setWeeklyLeaderboard(weeklyRes.data);
+      }
     } catch (error) {
       toast.error("Failed to load leaderboard");
     } finally {
+      fallbackPending.current = false;
       setLoading(false);
     }
   };
@@ -0,0 +1,23 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# server.py reads its settings at import time; point it at a local MongoDB that is never contacted
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "typing_master_test")
+os.environ.setdefault("ARCHIVE_INTERVAL_HOURS", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """An in-memory stand-in for the Motor database used by server.py."""
+    import server
+
+    database = AsyncMongoMockClient()["typing_master_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
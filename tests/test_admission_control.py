@@ -0,0 +1,116 @@
+import asyncio
+
+import server
+
+
+async def call(app, headers=(), body_chunks=(b"",), path="/api/tests/submit"):
+    """Drive an ASGI app with one request and return (status, body)."""
+    chunks = list(body_chunks)
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+    }
+    await app(scope, receive, send)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, body
+
+
+async def echo_app(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+def middleware(app=echo_app, **overrides):
+    options = {"max_concurrent": 1, "queue_timeout": 0, "max_body_bytes": 10}
+    options.update(overrides)
+    return server.AdmissionControlMiddleware(app, **options)
+
+
+def test_declared_oversized_body_is_rejected():
+    status, _ = asyncio.run(call(middleware(), headers=[("content-length", "11")], body_chunks=[b"x" * 11]))
+
+    assert status == 413
+
+
+def test_chunked_oversized_body_is_rejected():
+    status, _ = asyncio.run(call(
+        middleware(),
+        headers=[("transfer-encoding", "chunked")],
+        body_chunks=[b"x" * 6, b"x" * 6]
+    ))
+
+    assert status == 413
+
+
+def test_chunked_body_within_limit_is_replayed():
+    status, body = asyncio.run(call(
+        middleware(),
+        headers=[("transfer-encoding", "chunked")],
+        body_chunks=[b"abc", b"def"]
+    ))
+
+    assert (status, body) == (200, b"abcdef")
+
+
+def test_requests_over_concurrency_cap_are_shed():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            await release.wait()
+            await echo_app(scope, receive, send)
+
+        app = middleware(slow_app)
+        first = asyncio.create_task(call(app))
+        await asyncio.sleep(0)
+        second = await call(app)
+        release.set()
+        return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first[0] == 200
+    assert second[0] == 503
+
+
+def test_exempt_paths_bypass_concurrency_cap():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_app(scope, receive, send):
+            if scope["path"] == "/stream":
+                await release.wait()
+            await echo_app(scope, receive, send)
+
+        app = middleware(slow_app, exempt_paths=("/stream",))
+        stream = asyncio.create_task(call(app, path="/stream"))
+        await asyncio.sleep(0)
+        status, _ = await call(app)
+        release.set()
+        await stream
+        return status
+
+    assert asyncio.run(scenario()) == 200
@@ -0,0 +1,203 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def days_ago(days):
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+
+def session(id, wpm, accuracy, duration=60, age_days=200, **extra):
+    return {
+        "id": id, "user_id": "u1", "mode": "words", "duration": duration,
+        "content_hash": server.passage_hash(server.PRACTICE_CONTENT["words"]),
+        "wpm": wpm, "accuracy": accuracy, "errors": 0, "created_at": days_ago(age_days), **extra
+    }
+
+
+def result(id, wpm, accuracy, passed, age_days=200):
+    return {
+        "id": id, "user_id": "u1", "test_id": "t1", "wpm": wpm, "accuracy": accuracy, "errors": 0,
+        "duration": 900, "typed_text": "...", "passed": passed, "created_at": days_ago(age_days)
+    }
+
+
+def read_archive(path):
+    with gzip.open(path, "rt", encoding="utf-8") as archive_file:
+        return [json.loads(line) for line in archive_file]
+
+
+def stats():
+    return run(server.get_practice_stats({"id": "u1"}))
+
+
+@pytest.fixture
+def archive_dir(mongo_db, tmp_path, monkeypatch):
+    """Archive into a temporary directory against a database with the production indexes."""
+    run(server.ensure_history_indexes())
+    monkeypatch.setattr(server, "ARCHIVE_DIR", tmp_path)
+    return tmp_path
+
+
+def test_practice_sessions_fold_into_totals_and_best_session():
+    summary = {"$inc": {}, "$max": {}}
+    for doc in [
+        {"wpm": 40, "accuracy": 95, "duration": 60},
+        {"wpm": 55, "accuracy": 90, "duration": 120},
+        {"wpm": 55, "accuracy": 97, "duration": 60},
+    ]:
+        server.summarize_practice_session(summary, doc)
+
+    assert summary["$inc"] == {
+        "practice_sessions": 3,
+        "practice_wpm_total": 150,
+        "practice_accuracy_total": 282,
+        "practice_time_total": 240,
+    }
+    assert summary["$max"] == {"best_wpm": 55, "best_session": {"wpm": 55, "accuracy": 97}}
+
+
+def test_test_results_fold_into_totals_and_pass_count():
+    summary = {"$inc": {}, "$max": {}}
+    for doc in [{"wpm": 30, "accuracy": 92, "passed": False}, {"wpm": 42, "accuracy": 96, "passed": True}]:
+        server.summarize_test_result(summary, doc)
+
+    assert summary["$inc"] == {"test_results": 2, "test_wpm_total": 72, "test_accuracy_total": 188, "tests_passed": 1}
+    assert summary["$max"] == {"best_wpm": 42}
+
+
+def test_compaction_preserves_stats_and_archives_raw_documents(mongo_db, archive_dir):
+    run(mongo_db.practice_sessions.insert_many([
+        session("s1", 80, 90, duration=300),
+        session("s2", 50, 95, age_days=1),
+    ]))
+    run(mongo_db.test_results.insert_many([result("r1", 20, 100, False), result("r2", 30, 85, True, age_days=1)]))
+    before = stats()
+    best_before = run(server.get_user_best_stats("u1"))
+
+    outcome = run(server.compact_raw_history())
+
+    assert outcome["archived_practice_sessions"] == 1
+    assert outcome["archived_test_results"] == 1
+    assert run(mongo_db.practice_sessions.count_documents({})) == 1
+    assert run(mongo_db.test_results.count_documents({})) == 1
+    assert stats() == before == {
+        "total_tests": 4,
+        "average_wpm": 45.0,
+        "average_accuracy": 92.5,
+        "best_wpm": 80,
+        "total_practice_time": 360,
+    }
+    assert run(server.get_user_best_stats("u1")) == best_before == {"wpm": 80, "accuracy": 90}
+    archived = [doc["id"] for path in archive_dir.glob("practice_sessions-*.ndjson.gz") for doc in read_archive(path)]
+    assert archived == ["s1"]
+
+
+def test_rerunning_a_tagged_batch_does_not_double_count(mongo_db, archive_dir):
+    docs = [session("s1", 60, 90, archive_batch="b1"), session("s2", 40, 80, archive_batch="b1")]
+    run(mongo_db.practice_sessions.insert_many([dict(doc) for doc in docs]))
+    run(server.archive_batch("practice_sessions", "b1", server.summarize_practice_session))
+    summary = run(server.get_user_summary("u1"))
+
+    # A crash before delete_many leaves the tagged documents behind; the next run resumes them
+    run(mongo_db.practice_sessions.insert_many([dict(doc) for doc in docs]))
+    assert stats()["total_tests"] == 2  # tagged documents are only counted through the summary
+    assert run(server.archive_collection("practice_sessions", days_ago(90), server.summarize_practice_session)) == 2
+
+    assert run(mongo_db.user_history_summaries.count_documents({})) == 1
+    assert run(server.get_user_summary("u1")) == summary
+    assert summary["practice_sessions"] == 2
+    assert run(mongo_db.practice_sessions.count_documents({})) == 0
+
+
+def test_archived_passages_survive_passage_cleanup(mongo_db, archive_dir):
+    legacy_text = "a passage only some old sessions used"
+    run(mongo_db.practice_sessions.insert_one({**session("s1", 60, 90), "text_content": legacy_text}))
+    legacy_hash = server.passage_hash(legacy_text)
+    run(mongo_db.practice_sessions.update_one({"id": "s1"}, {"$unset": {"content_hash": ""}}))
+    run(server.migrate_session_passages())
+
+    outcome = run(server.compact_raw_history())
+
+    assert outcome["deleted_passages"] == 1
+    assert run(mongo_db.passages.find_one({"hash": legacy_hash})) is None
+    archived_passages = [doc for path in archive_dir.glob("passages-*.ndjson.gz") for doc in read_archive(path)]
+    assert [(doc["hash"], doc["content"]) for doc in archived_passages] == [(legacy_hash, legacy_text)]
+
+
+def test_overlapping_compaction_is_refused(mongo_db, archive_dir):
+    run(mongo_db.locks.insert_one({
+        "_id": "compaction",
+        "owner": "another-worker",
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)
+    }))
+
+    assert run(server.acquire_compaction_lease()) is False
+    assert run(server.compact_raw_history()) is None
+    with pytest.raises(HTTPException) as error:
+        run(server.run_archive({"id": "admin", "is_admin": True}))
+    assert error.value.status_code == 409
+
+
+def test_compaction_in_progress_in_this_process_is_refused(mongo_db, archive_dir):
+    async def scenario():
+        async with server.compaction_lock:
+            return await server.compact_raw_history()
+
+    assert run(scenario()) is None
+
+
+def test_expired_lease_is_taken_over_and_released(mongo_db, archive_dir):
+    run(mongo_db.locks.insert_one({
+        "_id": "compaction",
+        "owner": "crashed-worker",
+        "expires_at": datetime.now(timezone.utc) - timedelta(minutes=5)
+    }))
+
+    assert run(server.acquire_compaction_lease()) is True
+    assert run(server.acquire_compaction_lease()) is True  # renewing our own lease
+    run(server.release_compaction_lease())
+    assert run(mongo_db.locks.count_documents({})) == 0
+
+
+def test_migration_runs_only_once(mongo_db, monkeypatch):
+    monkeypatch.setattr(server, "ARCHIVE_BATCH_SIZE", 2)  # several passes over the legacy sessions
+    run(mongo_db.practice_sessions.insert_many([
+        {"id": f"s{i}", "user_id": "u1", "text_content": server.PRACTICE_CONTENT["numbers"]} for i in range(3)
+    ]))
+
+    assert run(server.migrate_session_passages()) == 3
+    assert run(mongo_db.practice_sessions.count_documents({"text_content": {"$exists": True}})) == 0
+    assert run(mongo_db.passages.count_documents({})) == 1
+
+    run(mongo_db.practice_sessions.insert_one({"id": "late", "user_id": "u1", "text_content": "x"}))
+    assert run(server.migrate_session_passages()) == 0
+    assert run(mongo_db.practice_sessions.find_one({"id": "late"}))["text_content"] == "x"
+
+
+def test_practice_session_with_unknown_passage_is_rejected(mongo_db):
+    session_data = server.PracticeSessionCreate(
+        mode="words", duration=60, typed_text="hi", original_text="anything the client wants",
+        wpm=40, accuracy=95, errors=0
+    )
+
+    with pytest.raises(HTTPException) as error:
+        run(server.create_practice_session(session_data, {"id": "u1", "xp": 0}))
+
+    assert error.value.status_code == 400
+    assert run(mongo_db.practice_sessions.count_documents({})) == 0
+
+
+def test_served_practice_passages_are_known():
+    for text in server.PRACTICE_CONTENT.values():
+        assert server.passage_hash(text) in server.PRACTICE_PASSAGES
@@ -0,0 +1,132 @@
+import asyncio
+
+import server
+
+
+def entry(username, xp):
+    return {"username": username, "xp": xp}
+
+
+class FakeBoards:
+    """Stands in for the leaderboard queries and counts how often they run."""
+
+    def __init__(self, board):
+        self.board = board
+        self.computes = 0
+        self.delay = 0
+
+    def install(self, monkeypatch):
+        async def global_leaderboard(limit):
+            self.computes += 1
+            board = list(self.board)
+            await asyncio.sleep(self.delay)
+            return board
+
+        async def weekly_leaderboard(limit):
+            return []
+
+        monkeypatch.setattr(server, "get_global_leaderboard", global_leaderboard)
+        monkeypatch.setattr(server, "get_weekly_leaderboard", weekly_leaderboard)
+
+
+def broadcaster(buffer_size=4):
+    return server.LeaderboardBroadcaster(top_n=10, buffer_size=buffer_size, min_interval=0)
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_diff_only_contains_changed_ranks():
+    old = {"global": [entry("a", 3), entry("b", 2), entry("c", 1)], "weekly": []}
+    new = {"global": [entry("a", 3), entry("c", 5), entry("b", 2)], "weekly": []}
+
+    assert server.leaderboard_diff(old, new) == {
+        "global": {"size": 3, "changes": [{"rank": 2, "entry": entry("c", 5)}, {"rank": 3, "entry": entry("b", 2)}]}
+    }
+
+
+def test_diff_reports_shrunk_board_and_nothing_when_unchanged():
+    board = {"global": [entry("a", 1), entry("b", 1)]}
+
+    assert server.leaderboard_diff(board, board) == {}
+    assert server.leaderboard_diff(board, {"global": [entry("a", 1)]}) == {"global": {"size": 1, "changes": []}}
+
+
+def test_slow_consumer_is_dropped_and_its_stream_ended():
+    async def scenario():
+        feed = broadcaster(buffer_size=1)
+        fast, slow = asyncio.Queue(maxsize=1), asyncio.Queue(maxsize=1)
+        slow.put_nowait(("snapshot", {}))
+        feed.subscribers.update({fast, slow})
+
+        feed._publish(("diff", {"global": {}}))
+        return feed, fast, slow
+
+    feed, fast, slow = asyncio.run(scenario())
+
+    assert feed.subscribers == {fast}
+    assert drain(fast) == [("diff", {"global": {}})]
+    assert drain(slow) == [None]
+
+
+def test_concurrent_subscribers_share_one_computation(monkeypatch):
+    boards = FakeBoards([entry("a", 1)])
+    boards.install(monkeypatch)
+
+    async def scenario():
+        feed = broadcaster()
+        queues = await asyncio.gather(*(feed.subscribe() for _ in range(50)))
+        return [queue.get_nowait() for queue in queues]
+
+    snapshots = asyncio.run(scenario())
+
+    assert boards.computes == 1
+    assert all(event == ("snapshot", {"global": [entry("a", 1)], "weekly": []}) for event in snapshots)
+
+
+def test_change_during_subscriber_compute_is_diffed_to_subscriber(monkeypatch):
+    boards = FakeBoards([entry("a", 1)])
+    boards.delay = 0.01
+    boards.install(monkeypatch)
+
+    async def scenario():
+        feed = broadcaster()
+        feed.start()
+        subscribing = asyncio.create_task(feed.subscribe())
+        await asyncio.sleep(0)  # subscriber's computation is in flight
+        boards.board = [entry("b", 9)]
+        feed.notify()
+        queue = await subscribing
+        await asyncio.sleep(0.05)
+        feed.stop()
+        return feed, drain(queue)
+
+    feed, events = asyncio.run(scenario())
+
+    assert events == [
+        ("snapshot", {"global": [entry("a", 1)], "weekly": []}),
+        ("diff", {"global": {"size": 1, "changes": [{"rank": 1, "entry": entry("b", 9)}]}}),
+    ]
+    assert feed.snapshot == {"global": [entry("b", 9)], "weekly": []}
+    assert feed.snapshot_version == feed.version
+
+
+def test_stream_ends_after_max_lifetime_with_reconnect_hint(monkeypatch):
+    FakeBoards([entry("a", 1)]).install(monkeypatch)
+    feed = broadcaster()
+    monkeypatch.setattr(server, "leaderboard_broadcaster", feed)
+    monkeypatch.setattr(server, "LEADERBOARD_STREAM_MAX_SECONDS", 0.05)
+
+    async def scenario():
+        response = await server.stream_leaderboard()
+        return [chunk async for chunk in response.body_iterator]
+
+    chunks = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+    assert chunks[0] == f"retry: {server.LEADERBOARD_STREAM_RETRY_MS}\n\n"
+    assert chunks[1].startswith("event: snapshot\n")
+    assert feed.subscribers == set()
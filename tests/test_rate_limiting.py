@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_request(client_host="10.0.0.1", forwarded=None):
+    headers = []
+    if forwarded is not None:
+        headers.append((b"x-forwarded-for", forwarded.encode()))
+    return Request({"type": "http", "headers": headers, "client": (client_host, 1234)})
+
+
+def test_backend_without_consume_cannot_be_instantiated():
+    class Incomplete(server.RateLimitBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_bucket_allows_capacity_then_reports_retry_after():
+    backend = server.InMemoryRateLimitBackend()
+    # 3 requests per 60 seconds refills one token every 20 seconds
+    results = [run(backend.consume("ip:1", 3, 3 / 60)) for _ in range(4)]
+
+    assert results[:3] == [0, 0, 0]
+    assert results[3] == pytest.approx(20, abs=0.1)
+
+
+def test_bucket_refills_over_time():
+    backend = server.InMemoryRateLimitBackend()
+    for _ in range(3):
+        run(backend.consume("ip:1", 3, 3 / 60))
+
+    backend.buckets["ip:1"][1] -= 30  # 30 seconds pass: 1.5 tokens back
+    assert run(backend.consume("ip:1", 3, 3 / 60)) == 0
+    assert run(backend.consume("ip:1", 3, 3 / 60)) == pytest.approx(10, abs=0.1)
+
+
+def test_bucket_never_exceeds_capacity():
+    backend = server.InMemoryRateLimitBackend()
+    run(backend.consume("ip:1", 2, 1))
+    backend.buckets["ip:1"][1] -= 3600
+
+    assert [run(backend.consume("ip:1", 2, 1)) for _ in range(2)] == [0, 0]
+    assert run(backend.consume("ip:1", 2, 1)) > 0
+
+
+def test_least_recently_used_bucket_is_evicted_at_max_keys():
+    backend = server.InMemoryRateLimitBackend(max_keys=2)
+    run(backend.consume("a", 5, 1))
+    run(backend.consume("b", 5, 1))
+    run(backend.consume("a", 5, 1))
+    run(backend.consume("c", 5, 1))
+
+    assert list(backend.buckets) == ["a", "c"]
+
+
+def test_client_ip_ignores_forwarded_header_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", 0)
+
+    assert server.get_client_ip(make_request(forwarded="1.2.3.4")) == "10.0.0.1"
+
+
+def test_client_ip_uses_entry_appended_by_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", 1)
+    request = make_request(forwarded="6.6.6.6, 203.0.113.7")
+
+    assert server.get_client_ip(request) == "203.0.113.7"
+
+
+def test_max_typed_text_length_scales_with_duration():
+    assert server.max_typed_text_length(60) == server.MAX_TYPING_WPM * server.CHARS_PER_WORD
+    assert server.max_typed_text_length(900) == 15 * server.max_typed_text_length(60)
+
+
+def test_mongo_backend_matches_in_memory_backend(mongo_db):
+    memory = server.InMemoryRateLimitBackend()
+    mongo = server.MongoRateLimitBackend(mongo_db.rate_limits)
+    run(mongo.ensure_indexes())
+
+    def consume_both():
+        return run(memory.consume("ip:1", 3, 3 / 60)), run(mongo.consume("ip:1", 3, 3 / 60))
+
+    for _ in range(3):
+        assert consume_both() == (0, 0)
+    denied_memory, denied_mongo = consume_both()
+    assert denied_mongo == pytest.approx(denied_memory, abs=0.1)
+    assert denied_mongo == pytest.approx(20, abs=0.1)
+
+    # 30 seconds pass for both: 1.5 tokens back, so one allowed and the next waits 10 seconds
+    memory.buckets["ip:1"][1] -= 30
+    run(mongo_db.rate_limits.update_one({"key": "ip:1"}, {"$inc": {"updated_at": -30}}))
+    assert consume_both() == (0, 0)
+    denied_memory, denied_mongo = consume_both()
+    assert denied_mongo == pytest.approx(denied_memory, abs=0.1)
+    assert denied_mongo == pytest.approx(10, abs=0.1)
+
+
+def test_mongo_backend_sets_expiry_and_keeps_keys_separate(mongo_db):
+    mongo = server.MongoRateLimitBackend(mongo_db.rate_limits)
+    run(mongo.consume("a", 2, 1))
+    run(mongo.consume("a", 2, 1))
+
+    assert run(mongo.consume("a", 2, 1)) > 0
+    assert run(mongo.consume("b", 2, 1)) == 0
+    bucket = run(mongo_db.rate_limits.find_one({"key": "a"}))
+    # The bucket may be forgotten once it would have refilled completely: capacity / rate = 2 seconds
+    updated = server.datetime.fromtimestamp(bucket["updated_at"], server.timezone.utc).replace(tzinfo=None)
+    assert (bucket["expires_at"] - updated).total_seconds() == pytest.approx(2, abs=0.01)